@@ -2,10 +2,15 @@
 
 import itertools
 import os
+import time
 from pathlib import Path
 
 from geometrics.toolbox.twod_to_threed import TwoDToThreeD
 
+from build_cache import BuildCache, engine_version
+from build_plan import compile_plan
+from dxf_sources import assemble_sources, classify_tiles, congruent_features, flatten_layers, index_sources, referenced_layers
+
 
 def main(do):
     # define where we'll read shapes from
@@ -3221,7 +3226,6 @@ def main(do):
     )
 
     if "masks" in do:
-        ttt = TwoDToThreeD(instructions=instructions, sources=sources)
         # to_build = ["active_mask_stack", "metal_mask_stack", "tco_30x30mm", "active_mask_stack_4x4", "tco_150x150mm"]
         # to_build = ["tco_30x30mm"]
         # to_build = ["full_device_Stack"]
@@ -3290,7 +3294,50 @@ def main(do):
         
         to_build = []
         to_build += build_2024_03_snaith
-        built = ttt.build(to_build, nparallel=12)
+
+        # parsed drawing layers are cached in here so warm runs don't have to parse the sources again
+        cache_dir = wrk_dir / ".cache"
+        # only hand over what to_build needs
+        needed = [instruction for instruction in instructions if to_build == [""] or instruction["name"] in to_build]
+        # drawing layers get cleaned of duplicate entities, gaps and needless vertices on the way in and outlines drawn as
+        # lots of short segments get turned back into the circles, arcs and straight sides they stand for (distances in mm)
+        heal = {"gap": 1e-3, "collinear": 1e-6, "duplicate": 1e-6, "primitives": 1e-3}
+        # extra reports on what's being built that take their own pass over the drawing layers
+        diagnostics = False
+        manifests, index, _, keep = index_sources(sources, cache_dir, instructions=needed, to_build=to_build, nparallel=12, heal=heal, diagnostics=diagnostics)
+        # 2d first mode: layers that are an outline less cutouts clear inside it get the cutouts taken out in 2d, so the
+        # engine only has to extrude them
+        flat_2d = False
+        if flat_2d:
+            needed, manifests, index = flatten_layers(cache_dir, manifests, index, needed, to_build=to_build, gap=heal["gap"])
+        # instructions whose fingerprint (the instruction, its drawing layers and geometrics) hasn't changed since they were
+        # last built get their result from the cache, only the rest get built, past 10 GiB the least recently used files
+        # anywhere in the cache go
+        builds = BuildCache(cache_dir, engine_version(TwoDToThreeD), max_bytes=10 * 2**30)
+        reused = builds.results(needed, index)
+        stale = [instruction for instruction in needed if instruction["name"] not in reused]
+        print(f"Reusing {len(reused)} unchanged builds, building {len(stale)}")
+        fresh = {}
+        if stale:
+            stale_names = [instruction["name"] for instruction in stale]
+            # how much of the work the stale instructions have in common
+            print(compile_plan(stale, index, keep).summary())
+            if diagnostics:
+                # and at how many array positions the cutouts actually meet their edge_case
+                positions = [position for layers in classify_tiles(cache_dir, index, stale, keep=keep).values() for classes in layers.values() for position in classes]
+                if positions:
+                    print(f"Edge cases only touch {positions.count('edge')} of {len(positions)} arrayed tile positions")
+                # and how many distinct shapes the openings being cut come in
+                shapes = congruent_features(cache_dir, index, stale, keep=keep).values()
+                if shapes:
+                    print(f"Cutouts hold {sum(len(copies) for layer in shapes for copies in layer.values())} openings in {sum(len(layer) for layer in shapes)} distinct shapes")
+            stale_sources = assemble_sources(cache_dir, manifests, index, referenced_layers(stale, stale_names).intersection(index), keep)
+            ttt = TwoDToThreeD(instructions=stale, sources=stale_sources)
+            started = time.perf_counter()
+            fresh = ttt.build(stale_names, nparallel=12)
+            print(f"Built {len(stale_names)} instructions in {time.perf_counter() - started:.1f} s")
+        builds.store(stale, index, fresh)
+        built = {**{instruction["name"]: reused[instruction["name"]] for instruction in needed if instruction["name"] in reused}, **fresh}
 
         # Note: exporting STLs screws up measurements https://github.com/CadQuery/cadquery/issues/798
         TwoDToThreeD.outputter(built, wrk_dir, save_dxfs=True, save_pdfs=True, save_steps=True, save_stls=False, edm_outputs=False, nparallel=12)
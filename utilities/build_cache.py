@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# keeps what TwoDToThreeD.build() made for each instruction so it doesn't have to be made again
+# an instruction's fingerprint covers the instruction itself, the content of every drawing layer it references (after
+# healing, as index_sources() hands them over) and the engine doing the building, a stored result is only reused when all
+# of that is unchanged
+# what prune_tools() drops isn't part of it: that depends on the other instructions being built alongside and only ever
+# takes out entities that can't change the result, so the whole layer is what counts
+
+import json
+import pickle
+import sys
+from importlib import metadata
+from pathlib import Path
+
+from dxf_sources import digest, evict, referenced_layers, touch, write_atomic
+
+
+def engine_version(engine):
+    # the versions of geometrics and the cad kernel under it along with a hash of all of geometrics' source, so edits to a
+    # dev install count too
+    versions = []
+    for name in ("geometrics", "cadquery", "cadquery-ocp"):
+        try:
+            versions.append(metadata.version(name))
+        except metadata.PackageNotFoundError:
+            versions.append(None)
+    package = sys.modules[engine.__module__.split(".")[0]]
+    source = []
+    for root in getattr(package, "__path__", []):
+        for path in sorted(Path(root).rglob("*.py")):
+            source.append(str(path.relative_to(root)).encode() + b"\n" + path.read_bytes())
+    return f"{':'.join(map(str, versions))}:{digest(b''.join(source))}"
+
+
+class BuildCache(object):
+    # with max_bytes the whole cache_dir (these results and what SourceCache keeps there) is kept to that size by
+    # dropping the least recently used files, see evict()
+    def __init__(self, cache_dir, engine_version, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.builds_dir = cache_dir / "builds"
+        self.builds_dir.mkdir(parents=True, exist_ok=True)
+        self.engine_version = engine_version
+        self.max_bytes = max_bytes
+
+    def fingerprint(self, instruction, index):
+        # drawing layers that aren't in any source count too, they might turn up later
+        layers = {name: index[name]["hash"] if name in index else None for name in sorted(referenced_layers([instruction], [""]))}
+        return digest(json.dumps([self.engine_version, instruction, layers], sort_keys=True, default=repr).encode())
+
+    def result_file(self, fingerprint):
+        return self.builds_dir / f"{fingerprint}.pickle"
+
+    def results(self, instructions, index):
+        # {instruction name: result} for the instructions that have a stored result matching their fingerprint
+        results = {}
+        for instruction in instructions:
+            stored = self.result_file(self.fingerprint(instruction, index))
+            if touch(stored):
+                try:
+                    results[instruction["name"]] = pickle.loads(stored.read_bytes())
+                except Exception as e:
+                    print(f"Warning: not reusing the stored build of {instruction['name']}: {e}")
+        return results
+
+    def store(self, instructions, index, built):
+        # keeps what build() made for the instructions, results that can't be pickled just don't get kept
+        for instruction in instructions:
+            if instruction["name"] not in built:
+                continue
+            try:
+                data = pickle.dumps(built[instruction["name"]], protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                print(f"Warning: not storing the build of {instruction['name']}: {e}")
+                continue
+            write_atomic(self.result_file(self.fingerprint(instruction, index)), data)
+        if self.max_bytes is not None:
+            evict(self.cache_dir, self.max_bytes)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# the instructions as a graph of the operations TwoDToThreeD carries out for them, so work they have in common shows up
+# every node is keyed by a hash of what it does and the keys of what it works on, drawing layers by the hash of their
+# geometry (see split_layers()), so two nodes with the same key come out the same whatever the instructions or drawing
+# layers are called
+
+import json
+
+from dxf_sources import digest
+
+
+class BuildPlan(object):
+    def __init__(self, index, keep):
+        self.index = index
+        self.keep = keep
+        # {key: (operation, [keys of the nodes it works on], parameters)}
+        self.nodes = {}
+        # {key: how many times it was asked for}
+        self.uses = {}
+        # {instruction name: key of its stack}
+        self.roots = {}
+
+    def node(self, operation, inputs, **parameters):
+        key = digest(json.dumps([operation, inputs, parameters], sort_keys=True, default=repr).encode())
+        if key not in self.nodes:
+            self.nodes[key] = (operation, inputs, parameters)
+        self.uses[key] = self.uses.get(key, 0) + 1
+        return key
+
+    def profile(self, name):
+        # the outlines on a drawing layer, after healing and pruning
+        if name not in self.index:
+            return self.node("missing", [], name=name)
+        return self.node("profile", [], geometry=self.index[name]["geometry"], keep=self.keep.get(name))
+
+    def tool(self, drawing_layer):
+        # what one entry in drawing_layer_names cuts, the tuple forms are (layer, angle), (layer, 0) for embossing and
+        # (layer, loft layer)
+        if not isinstance(drawing_layer, tuple):
+            return self.profile(drawing_layer)
+        name, other = drawing_layer
+        if isinstance(other, str):
+            return self.node("loft", [self.profile(name), self.profile(other)])
+        if other == 0:
+            return self.node("emboss", [self.profile(name)])
+        return self.node("taper", [self.profile(name)], angle=other)
+
+    def layer(self, layer):
+        first, *rest = layer["drawing_layer_names"]
+        body = self.node("extrude", [self.tool(first)], thickness=layer["thickness"], z_base=layer.get("z_base"))
+        for drawing_layer in rest:
+            cutter = self.node("extrude", [self.tool(drawing_layer)], thickness=layer["thickness"], z_base=layer.get("z_base"))
+            if "array" in layer:
+                cutter = self.node("array", [cutter], offsets=layer["array"])
+            if "edge_case" in layer:
+                cutter = self.node("clip", [cutter, self.profile(layer["edge_case"])])
+            body = self.node("cut", [body, cutter])
+        if "edm_dent" in layer:
+            body = self.node("dent", [body, self.profile(layer["edm_dent"])], depth=layer.get("edm_dent_depth"))
+        return body
+
+    def add(self, instruction):
+        layers = [self.layer(layer) for layer in instruction["layers"]]
+        parameters = {key: value for key, value in instruction.items() if key not in ("name", "layers")}
+        self.roots[instruction["name"]] = self.node("stack", layers, **parameters)
+        return self.roots[instruction["name"]]
+
+    def shared(self):
+        # {key: uses} for the nodes asked for more than once, each only needs doing once
+        return {key: uses for key, uses in self.uses.items() if uses > 1}
+
+    def summary(self):
+        # drawing layers that aren't in any source don't count, there's nothing to do for them
+        real = {key for key, (operation, _, _) in self.nodes.items() if operation != "missing"}
+        asked = sum(self.uses[key] for key in real)
+        by_operation = {}
+        for key in real.intersection(self.shared()):
+            operation = self.nodes[key][0]
+            by_operation[operation] = by_operation.get(operation, 0) + 1
+        return f"{len(self.roots)} instructions ask for {asked} operations, {len(real)} of them distinct, {sum(by_operation.values())} come up more than once ({', '.join(f'{n} {operation}' for operation, n in sorted(by_operation.items()))})"
+
+
+def compile_plan(instructions, index, keep):
+    # the BuildPlan for the instructions, with the index and keep index_sources() gives
+    plan = BuildPlan(index, keep)
+    for instruction in instructions:
+        plan.add(instruction)
+    return plan
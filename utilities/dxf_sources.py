@@ -0,0 +1,956 @@
+#!/usr/bin/env python3
+
+# prepares the dxf drawings that TwoDToThreeD reads its shapes from
+# each source is split into per drawing layer chunks of entity data which get stored on disk keyed by a hash of their content
+# so a warm run never has to parse a drawing again and an edit to one drawing layer only invalidates that layer's chunk
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from polygons import PolygonStore, STRTree, arc_bbox, bulge_arc, merge_bbox, pair_rings, placed_boxes, ring_circle
+
+BINARY_SENTINEL = b"AutoCAD Binary DXF\r\n\x1a\x00"
+
+# value types of the group codes in binary dxf, anything not listed is a zero terminated string
+BINARY_CHUNK_CODES = {*range(310, 320), 1004}
+BOOL_CODES = {*range(290, 300)}
+INT16_CODES = {*range(60, 80), *range(170, 180), *range(270, 290), *range(370, 390), *range(400, 410), *range(1060, 1071)}
+INT32_CODES = {*range(90, 100), *range(420, 430), *range(440, 460), 1071}
+INT64_CODES = {*range(160, 170)}
+DOUBLE_CODES = {*range(10, 60), *range(110, 150), *range(210, 240), *range(460, 470), *range(1010, 1060)}
+
+# bumped whenever what goes into the cache changes so stale manifests get thrown away
+MANIFEST_VERSION = 7
+# same for healed drawing layers
+HEAL_VERSION = 5
+
+
+@contextmanager
+def mapped(path):
+    # the file's bytes memory-mapped read only so tags can be streamed without reading the whole thing in
+    with open(path, "rb") as f:
+        if Path(path).stat().st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_tags(path):
+    # yields (group code, raw value) pairs from an ascii or binary dxf
+    with mapped(path) as data:
+        if not data:
+            return
+        if data[: len(BINARY_SENTINEL)] == BINARY_SENTINEL:
+            yield from read_binary_tags(data)
+            return
+        readline = data.readline
+        while True:
+            code = readline()
+            if not code:
+                break
+            code = int(code)
+            yield code, normalized(code, readline().rstrip(b"\r\n"))
+
+
+def normalized(code, value):
+    # an ascii value rendered the way read_binary_tags() renders it, so numbers hash the same whether a drawing was saved
+    # as ascii or binary and whatever padding or precision the ascii writer used, the tags themselves still have to match:
+    # writers that leave out tags at their default value (ezdxf drops an LWPOLYLINE's 43 constant width of 0.0, say)
+    # give different chunks for the same geometry
+    try:
+        if code in DOUBLE_CODES:
+            return repr(float(value)).encode()
+        if code in INT16_CODES or code in INT32_CODES or code in INT64_CODES or code in BOOL_CODES:
+            return b"%d" % int(value)
+    except ValueError:
+        pass
+    return value
+
+
+def read_binary_tags(data):
+    # yields (group code, raw value) pairs from binary dxf data with the values rendered as they would be in an ascii dxf
+    # R12 and older use one byte group codes, later versions two
+    start = data.find(b"$ACADVER", len(BINARY_SENTINEL), 1024)
+    if start < 0:
+        r12 = True
+    else:
+        start += 10
+        if data[start] != ord("A"):
+            start += 1
+        r12 = data[start : start + 6] <= b"AC1009"
+    unpack_from = struct.unpack_from
+    i = len(BINARY_SENTINEL)
+    n = len(data)
+    while i < n:
+        code = data[i]
+        if not r12:
+            code |= data[i + 1] << 8
+            i += 2
+        elif code == 255:
+            code = data[i + 1] | data[i + 2] << 8
+            i += 3
+        else:
+            i += 1
+
+        if code in DOUBLE_CODES:
+            value = repr(unpack_from("<d", data, i)[0]).encode()
+            i += 8
+        elif code in INT16_CODES:
+            value = b"%d" % unpack_from("<h", data, i)
+            i += 2
+        elif code in INT32_CODES:
+            value = b"%d" % unpack_from("<i", data, i)
+            i += 4
+        elif code in INT64_CODES:
+            value = b"%d" % unpack_from("<q", data, i)
+            i += 8
+        elif code in BOOL_CODES:
+            value = b"%d" % data[i]
+            i += 1
+        elif code in BINARY_CHUNK_CODES:
+            length = data[i]
+            value = data[i + 1 : i + 1 + length].hex().upper().encode()
+            i += 1 + length
+        else:
+            end = data.find(b"\x00", i)
+            value = data[i:end]
+            i = end + 1
+        yield code, value
+
+
+# entities whose coordinates are in their object coordinate system, that's mirrored in x when the extrusion direction is -z
+OCS_ENTITIES = {b"LWPOLYLINE", b"POLYLINE", b"CIRCLE", b"ARC"}
+# entities that carry on with these until the next proper entity starts
+FOLLOWERS = {b"VERTEX", b"SEQEND", b"ATTRIB"}
+# group codes that bounding boxes get calculated from
+BBOX_CODES = {0, 10, 20, 11, 21, 40, 42, 50, 51, 230}
+# group codes that name an entity or tie it to others (handle, layer, reactors and owner) rather than say what it is
+NAMING_CODES = {5, 8, 102, 330, 360}
+# entities whose bounding box can be had from their own coordinates, the rest (inserts, text, dimensions, hatches, splines,
+# solids...) draw things their coordinates don't bound
+BBOX_ENTITIES = {b"LINE", b"ARC", b"CIRCLE", b"ELLIPSE", b"LWPOLYLINE", b"POLYLINE", b"POINT"}
+
+
+def entity_bbox(kind, values):
+    # a 2d bounding box for an entity from its (group code, float) coordinate values, exact for lines, circles, arcs and
+    # polylines and conservative for ellipses, None when there's no telling (not one of BBOX_ENTITIES or no coordinates)
+    if kind not in BBOX_ENTITIES:
+        return None
+    points = []  # [x, y, bulge]
+    radius = 0.0
+    angles = [0.0, 360.0]
+    axis = None
+    mirror = False
+    started = kind != b"POLYLINE"  # a polyline's own point is a dummy, its vertices follow it
+    for code, v in values:
+        if code == 0:
+            started = True
+        elif code == 230:
+            mirror = v < 0
+        elif not started:
+            continue
+        elif code == 10:
+            points.append([v, 0.0, 0.0])
+        elif code == 20 and points:
+            points[-1][1] = v
+        elif code == 11:
+            axis = [v, 0.0]
+            if kind != b"ELLIPSE":
+                points.append([v, 0.0, 0.0])
+        elif code == 21 and axis is not None:
+            axis[1] = v
+            if kind != b"ELLIPSE":
+                points[-1][1] = v
+        elif code == 40:
+            radius = v
+        elif code == 42 and points:
+            points[-1][2] = v
+        elif code == 50:
+            angles[0] = v
+        elif code == 51:
+            angles[1] = v
+    if not points:
+        return None
+
+    x, y = points[0][:2]
+    if kind == b"ARC":
+        sweep = (angles[1] - angles[0]) % 360 or 360
+        bbox = arc_bbox(x, y, radius, math.radians(angles[0]), math.radians(sweep))
+    elif kind in (b"CIRCLE", b"ELLIPSE"):
+        if kind == b"ELLIPSE" and axis is not None:
+            radius = math.hypot(*axis)
+        bbox = (x - radius, y - radius, x + radius, y + radius)
+    else:
+        bbox = (min(p[0] for p in points), min(p[1] for p in points), max(p[0] for p in points), max(p[1] for p in points))
+        # polylines close back on themselves with their last bulge, open ones have no bulge there
+        for (x1, y1, bulge), (x2, y2, _) in zip(points, points[1:] + points[:1]):
+            if bulge and (x1, y1) != (x2, y2):
+                bbox = merge_bbox(bbox, arc_bbox(*bulge_arc(x1, y1, x2, y2, bulge)))
+    if mirror and kind in OCS_ENTITIES:
+        bbox = (-bbox[2], bbox[1], -bbox[0], bbox[3])
+    return bbox
+
+
+def iter_entities(data):
+    # yields (kind, [(group code, raw value), ...]) for each entity in a cached chunk of entity data
+    lines = data.split(b"\n")
+    kind = None
+    tags = None
+    for i in range(0, len(lines) - 1, 2):
+        code = int(lines[i])
+        value = lines[i + 1]
+        if code == 0 and not (value in FOLLOWERS and kind is not None):
+            if kind is not None:
+                yield kind, tags
+            kind = value
+            tags = []
+        tags.append((code, value))
+    if kind is not None:
+        yield kind, tags
+
+
+def entity_rings(kind, tags):
+    # the rings an entity's outline is made of as [(vertices, bulges, closed), ...] in world xy
+    # lines, arcs, circles and 2d polylines are understood, everything else has no outline
+    points = []  # [x, y, bulge]
+    flags = 0
+    x = y = r = 0.0
+    angles = [0.0, 360.0]
+    end = [0.0, 0.0]
+    mirror = False
+    in_vertex = False
+    for code, value in tags:
+        if code == 0:
+            in_vertex = value == b"VERTEX"
+        elif code == 230:
+            mirror = float(value) < 0
+        elif code == 70 and not in_vertex:
+            flags = int(value)
+        elif code == 10:
+            x = float(value)
+            if kind == b"LWPOLYLINE" or in_vertex:
+                points.append([x, 0.0, 0.0])
+        elif code == 20:
+            y = float(value)
+            if points and (kind == b"LWPOLYLINE" or in_vertex):
+                points[-1][1] = y
+        elif code == 42 and points:
+            points[-1][2] = float(value)
+        elif code == 11:
+            end[0] = float(value)
+        elif code == 21:
+            end[1] = float(value)
+        elif code == 40:
+            r = float(value)
+        elif code == 50:
+            angles[0] = float(value)
+        elif code == 51:
+            angles[1] = float(value)
+
+    if kind == b"LINE":
+        return [([(x, y), tuple(end)], [0.0, 0.0], False)]
+    if kind == b"ARC":
+        sweep = (angles[1] - angles[0]) % 360
+        if sweep:
+            start, stop = math.radians(angles[0]), math.radians(angles[0] + sweep)
+            points = [[x + r * math.cos(start), y + r * math.sin(start), math.tan(math.radians(sweep) / 4)], [x + r * math.cos(stop), y + r * math.sin(stop), 0.0]]
+            flags = 0
+        else:
+            kind = b"CIRCLE"
+    if kind == b"CIRCLE":
+        points = [[x + r, y, 1.0], [x - r, y, 1.0]]
+        flags = 1
+    elif kind == b"POLYLINE" and flags & (8 | 16 | 64):
+        return []  # 3d polylines and meshes
+    elif kind not in (b"LWPOLYLINE", b"POLYLINE", b"ARC"):
+        return []
+    if not points:
+        return []
+    if mirror and kind in OCS_ENTITIES:
+        points = [[-px, py, -bulge] for px, py, bulge in points]
+    return [([(px, py) for px, py, _ in points], [bulge for _, _, bulge in points], bool(flags & 1))]
+
+
+def lwpolyline(layer, coords, bulges, closed):
+    # entity data for an LWPOLYLINE, the handle gets assigned by whatever reads the drawing
+    tags = [b"  0\nLWPOLYLINE\n100\nAcDbEntity\n  8\n%s\n100\nAcDbPolyline\n 90\n%d\n 70\n%d\n" % (layer.encode(), len(coords), 1 if closed else 0)]
+    for (x, y), bulge in zip(coords, bulges):
+        tags.append(b" 10\n%s\n 20\n%s\n" % (repr(float(x)).encode(), repr(float(y)).encode()))
+        if bulge:
+            tags.append(b" 42\n%s\n" % repr(float(bulge)).encode())
+    return b"".join(tags)
+
+
+def circle(layer, x, y, r):
+    # entity data for a CIRCLE, which the engine can turn straight into a cylinder
+    return b"  0\nCIRCLE\n100\nAcDbEntity\n  8\n%s\n100\nAcDbCircle\n 10\n%s\n 20\n%s\n 30\n0.0\n 40\n%s\n" % (layer.encode(), repr(float(x)).encode(), repr(float(y)).encode(), repr(float(r)).encode())
+
+
+def ring_entities(layer, rings):
+    # entity data for (coords, bulges, closed, ...) rings, circles go out as CIRCLEs and the rest as LWPOLYLINEs
+    return [circle(layer, *ring_circle(coords, bulges, closed)) if ring_circle(coords, bulges, closed) else lwpolyline(layer, coords, bulges, closed) for coords, bulges, closed, *_ in rings]
+
+
+def add_layer(head, template, name):
+    # a copy of head with drawing layer name added to its layer table, looking like the template layer and with a fresh
+    # handle taken from $HANDSEED, None when head doesn't have what that needs
+    lines = head.split(b"\n")
+    tags = [[int(lines[i]), lines[i + 1]] for i in range(0, len(lines) - 1, 2)]
+    handle = None
+    for i, (code, value) in enumerate(tags[:-1]):
+        if code == 9 and value.strip() == b"$HANDSEED":
+            handle = int(tags[i + 1][1].strip(), 16)
+            tags[i + 1][1] = b"%X" % (handle + 1)
+            break
+    if handle is None:
+        return None
+    starts = [i for i, (code, value) in enumerate(tags) if code == 0]
+    for start, end in zip(starts, starts[1:]):
+        record = tags[start:end]
+        if record[0][1].strip() == b"LAYER" and [2, template.encode()] in record:
+            copy = [[code, name.encode() if code == 2 else b"%X" % handle if code == 5 else value] for code, value in record]
+            tags[end:end] = copy
+            return b"".join(b"%3d\n%s\n" % (code, value) for code, value in tags)
+    return None
+
+
+def dxf_version(head):
+    # the $ACADVER of a drawing from the entity-less part of it split_layers() gives, AC1009 (R12) if it doesn't say
+    start = head.find(b"$ACADVER\n  1\n")
+    if start < 0:
+        return "AC1009"
+    start += len(b"$ACADVER\n  1\n")
+    return head[start : head.index(b"\n", start)].decode(errors="replace").strip()
+
+
+def split_layers(tags, layers=None):
+    # splits a drawing into the part before its entities, the entities grouped by drawing layer and the part after them
+    # every drawing layer gets hashed and measured but only the entities on the given layers (or all of them) are kept in memory
+    # returns head, {layer: entity data}, tail and for every layer {"hash", "geometry", "bbox", "entities": [first index, last
+    # index], "entity_bboxes": [bbox of each of its entities], "offsets": [where each of its entities starts in its data]}
+    # "geometry" hashes the entity data less the NAMING_CODES, so it's the same for the same entities on any drawing layer
+    head = bytearray()
+    kept = {}
+    info = {}
+    hashes = {}
+    geometries = {}
+    sizes = {}
+    tail = bytearray()
+    chunk = None
+    shape = None
+    kind = None
+    values = None
+    layer = None
+    index = -1
+    in_entities = False
+    done_entities = False
+    previous = None
+    for code, value in tags:
+        line = b"%3d\n%s\n" % (code, value)
+        if in_entities:
+            if code == 0 and not (value in FOLLOWERS and chunk is not None):
+                # a new entity (or the end of the section) means the last one is complete
+                if chunk is not None:
+                    layer = "0" if layer is None else layer
+                    if layer not in info:
+                        hashes[layer] = hashlib.sha256()
+                        geometries[layer] = hashlib.sha256()
+                        sizes[layer] = 0
+                        info[layer] = {"hash": None, "geometry": None, "bbox": None, "entities": [index, index], "entity_bboxes": [], "offsets": []}
+                    hashes[layer].update(chunk)
+                    geometries[layer].update(shape)
+                    bbox = entity_bbox(kind, values)
+                    info[layer]["bbox"] = merge_bbox(info[layer]["bbox"], bbox)
+                    info[layer]["entities"][1] = index
+                    info[layer]["entity_bboxes"].append(bbox)
+                    info[layer]["offsets"].append(sizes[layer])
+                    sizes[layer] += len(chunk)
+                    if layers is None or layer in layers:
+                        kept.setdefault(layer, bytearray()).extend(chunk)
+                    chunk = None
+                    layer = None
+                if value == b"ENDSEC":
+                    in_entities = False
+                    done_entities = True
+                    tail.extend(line)
+                    continue
+                chunk = bytearray()
+                shape = bytearray()
+                kind = value
+                values = []
+                index += 1
+            elif code in BBOX_CODES:
+                values.append((code, 0.0 if code == 0 else float(value)))
+            if code == 8 and layer is None:
+                layer = value.decode(errors="replace")
+            chunk.extend(line)
+            if code not in NAMING_CODES:
+                shape.extend(line)
+            continue
+        if done_entities:
+            tail.extend(line)
+            continue
+        head.extend(line)
+        if previous == (0, b"SECTION") and code == 2:
+            in_entities = value == b"ENTITIES"
+        previous = (code, value)
+    for layer, h in hashes.items():
+        info[layer]["hash"] = h.hexdigest()
+        info[layer]["geometry"] = geometries[layer].hexdigest()
+    return bytes(head), {name: bytes(data) for name, data in kept.items()}, bytes(tail), info
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_atomic(path, data):
+    # other processes may be writing the same file at the same time, so each writes its own temporary file first
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def touch(path):
+    # marks a cached file as just used for evict(), access times can't be relied on (noatime mounts) so that's its
+    # modification time, returns whether the file is there
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def evict(cache_dir, max_bytes):
+    # drops the least recently used files anywhere under cache_dir until the rest fit in max_bytes, whatever goes is made
+    # again when it's next needed (a manifest missing one of its chunks counts as stale and its source gets scanned again)
+    cached = []
+    for path in Path(cache_dir).rglob("*"):
+        if path.name.endswith(".tmp"):
+            continue  # still being written
+        try:
+            if not path.is_file():
+                continue
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # another process got to it first
+        cached.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _, size, _ in cached)
+    for _, size, path in sorted(cached):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class SourceCache(object):
+    # on disk store of drawing chunks, addressed by the hash of their content
+    # every file in it is touch()ed when it's used so evict() can tell what's worth keeping
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.parts_dir = self.cache_dir / "parts"
+        self.manifests_dir = self.cache_dir / "manifests"
+        self.drawings_dir = self.cache_dir / "drawings"
+        self.heals_dir = self.cache_dir / "heals"
+        for d in (self.parts_dir, self.manifests_dir, self.drawings_dir, self.heals_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+    def put(self, data):
+        key = digest(data)
+        part = self.parts_dir / f"{key}.part"
+        if not touch(part):
+            write_atomic(part, data)
+        return key
+
+    def get(self, key):
+        part = self.parts_dir / f"{key}.part"
+        data = part.read_bytes()
+        touch(part)
+        return data
+
+    def has(self, key):
+        return touch(self.parts_dir / f"{key}.part")
+
+    def manifest_file(self, source):
+        return self.manifests_dir / f"{digest(str(Path(source).resolve()).encode())}.json"
+
+    def manifest(self, source, layers=None):
+        # returns what we know about a source's drawing layers, only parsing it when it changed on disk since the last time we looked
+        # or when chunks for some of the given drawing layers (or all of them) have not been stored yet
+        manifest = self.cached_manifest(source, layers)
+        if manifest is None:
+            manifest = self.scan(source, layers)
+        return manifest
+
+    def cached_manifest(self, source, layers=None):
+        # the stored manifest for a source if it's still good for the given drawing layers, None otherwise
+        manifest_file = self.manifest_file(source)
+        if not touch(manifest_file):
+            return None
+        stat = Path(source).stat()
+        manifest = json.loads(manifest_file.read_text())
+        if (manifest.get("version"), manifest["size"], manifest["mtime_ns"]) != (MANIFEST_VERSION, stat.st_size, stat.st_mtime_ns):
+            return None
+        wanted = manifest["layers"].keys() if layers is None else layers.intersection(manifest["layers"])
+        if not all(self.has(key) for key in [manifest["head"], manifest["tail"], *(manifest["layers"][name]["hash"] for name in wanted)]):
+            return None
+        return manifest
+
+    def scan(self, source, layers=None):
+        # parses a source, storing chunks for the given drawing layers (or all of them) and its manifest
+        source = Path(source).resolve()
+        stat = source.stat()
+        head, kept, tail, info = split_layers(read_tags(source), layers)
+        for data in kept.values():
+            self.put(data)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "source": str(source),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "dxfversion": dxf_version(head),
+            "head": self.put(head),
+            "tail": self.put(tail),
+            "layers": info,
+        }
+        write_atomic(self.manifest_file(source), json.dumps(manifest, indent=1).encode())
+        return manifest
+
+    def heal(self, entry, name, options):
+        # a stand in for a drawing layer's index entry whose outlines went through PolygonStore.healed(options), along with
+        # what changed, entities that aren't outlines are carried over as they are and the entry is returned untouched
+        # when there was nothing to fix
+        key = digest(json.dumps([HEAL_VERSION, entry["hash"], sorted(options.items())]).encode())
+        record = self.heals_dir / f"{key}.json"
+        if touch(record):
+            healed = json.loads(record.read_text())
+            if healed["hash"] is None or self.has(healed["hash"]):
+                return ({**entry, **healed["entry"]}, healed["report"]) if healed["hash"] else (entry, {})
+
+        data = self.get(entry["hash"])
+        store = PolygonStore.from_rings({name: [(*ring, n) for n, (kind, tags) in enumerate(iter_entities(data)) for ring in entity_rings(kind, tags)]})
+        fixed, report = store.healed(**options)
+        # circles already drawn as two vertex polylines don't need healing but should still go out as CIRCLEs
+        if options.get("primitives") is not None:
+            drawn = sum(1 for kind, tags in iter_entities(data) if kind != b"CIRCLE" for ring in entity_rings(kind, tags) if ring_circle(*ring))
+            if drawn:
+                report.setdefault(name, {})
+                report[name]["circles found"] = report[name].get("circles found", 0) + drawn
+        if not report:
+            write_atomic(record, json.dumps({"hash": None, "entry": {}, "report": {}}).encode())
+            return entry, {}
+        outlines = set(store.entities.tolist())
+        parts = [b"".join(b"%3d\n%s\n" % tag for tag in tags) for n, (kind, tags) in enumerate(iter_entities(data)) if n not in outlines]
+        healed = self.entry(parts + ring_entities(name, fixed.rings()))
+        write_atomic(record, json.dumps({"hash": healed["hash"], "entry": healed, "report": report[name]}).encode())
+        return {**entry, **healed}, report[name]
+
+    def entry(self, parts):
+        # a stand in for a drawing layer's index entry ({"hash", "geometry", "bbox", "entity_bboxes", "offsets"}) holding the
+        # given entities
+        shape = b"".join(b"%3d\n%s\n" % tag for part in parts for _, tags in iter_entities(part) for tag in tags if tag[0] not in NAMING_CODES)
+        entry = {"hash": self.put(b"".join(parts)), "geometry": digest(shape), "bbox": None, "entity_bboxes": [], "offsets": []}
+        offset = 0
+        for part in parts:
+            kind, tags = next(iter_entities(part))
+            bbox = entity_bbox(kind, [(code, 0.0 if code == 0 else float(value)) for code, value in tags if code in BBOX_CODES])
+            entry["bbox"] = merge_bbox(entry["bbox"], bbox)
+            entry["entity_bboxes"].append(bbox)
+            entry["offsets"].append(offset)
+            offset += len(part)
+        return entry
+
+    def layer_store(self, entry, name, numbers=None):
+        # the outlines in an index entry as a PolygonStore, only those of the given entity numbers if there are any
+        rings = [(*ring, n) for n, (kind, tags) in enumerate(iter_entities(self.get(entry["hash"]))) for ring in entity_rings(kind, tags)]
+        if numbers is not None:
+            numbers = set(numbers)
+            rings = [ring for ring in rings if ring[3] in numbers]
+        return PolygonStore.from_rings({name: rings})
+
+    def drawing(self, manifest, layers=None, keep=None, entries=None):
+        # assembles a dxf from cached chunks, only containing the given drawing layers (or all of them)
+        # keep can limit drawing layers to some of their entities, {layer: [entity numbers within the layer]}
+        # entries can stand in for some of the manifest's layers, e.g. healed ones, {layer: {"hash", "offsets"}}
+        if layers is None:
+            layers = manifest["layers"].keys()
+        if keep is None:
+            keep = {}
+        info = {**manifest["layers"], **(entries or {})}
+        layers = sorted(layers)
+        keys = [manifest["head"], *(info[name]["hash"] for name in layers), manifest["tail"]]
+        picks = [(name, sorted(keep[name])) for name in layers if name in keep]
+        stem = Path(manifest["source"]).stem
+        drawing = self.drawings_dir / f"{stem}-{digest(json.dumps([keys, picks]).encode())[:16]}.dxf"
+        if not touch(drawing):
+            parts = [self.get(manifest["head"])]
+            for name in layers:
+                data = self.get(info[name]["hash"])
+                if name in keep:
+                    bounds = info[name]["offsets"] + [len(data)]
+                    data = b"".join(data[bounds[i] : bounds[i + 1]] for i in sorted(keep[name]))
+                parts.append(data)
+            parts.append(self.get(manifest["tail"]))
+            write_atomic(drawing, b"".join(parts))
+        return drawing
+
+
+def referenced_layers(instructions, to_build):
+    # the set of drawing layers the instructions named in to_build need, [""] means all of them like in TwoDToThreeD.build
+    layers = set()
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            continue
+        for layer in instruction["layers"]:
+            for drawing_layer in layer["drawing_layer_names"]:
+                if isinstance(drawing_layer, tuple):
+                    # (layer, angle), (layer, 0) for embossing or (layer, loft_layer)
+                    layers.update(name for name in drawing_layer if isinstance(name, str))
+                else:
+                    layers.add(drawing_layer)
+            for key in ("edge_case", "edm_dent"):
+                if key in layer:
+                    layers.add(layer[key])
+    return layers
+
+
+def scan_source(cache_dir, source, layers):
+    # process pool entry point
+    return SourceCache(cache_dir).scan(source, layers)
+
+
+def load_sources(sources, cache_dir, layers=None, nparallel=1):
+    # returns the manifests of the given sources, making sure chunks for the given drawing layers (or all of them) are cached
+    # sources that need parsing are parsed in parallel in up to nparallel processes
+    cache = SourceCache(cache_dir)
+    manifests = [cache.cached_manifest(source, layers) for source in sources]
+    stale = [source for source, manifest in zip(sources, manifests) if manifest is None]
+    if len(stale) > 1 and nparallel > 1:
+        with ProcessPoolExecutor(max_workers=min(nparallel, len(stale))) as executor:
+            scanned = dict(zip(stale, executor.map(scan_source, [cache_dir] * len(stale), stale, [layers] * len(stale))))
+    else:
+        scanned = {source: cache.scan(source, layers) for source in stale}
+    return [scanned[source] if manifest is None else manifest for source, manifest in zip(sources, manifests)]
+
+
+def index_layers(manifests):
+    # builds {drawing layer name: {"source", "hash", "bbox", "entities"}} over all sources
+    # a drawing layer defined in more than one source comes from the first of them in the list, the others are shadowed
+    # returns the index and {drawing layer name: [every source defining it, winner first]}
+    index = {}
+    defined_in = {}
+    for manifest in manifests:
+        for name, info in manifest["layers"].items():
+            defined_in.setdefault(name, []).append(manifest["source"])
+            if name not in index:
+                index[name] = {"source": manifest["source"], **info}
+    shadowed = {name: where for name, where in defined_in.items() if len(where) > 1}
+    return index, shadowed
+
+
+def prune_tools(cache_dir, index, instructions, to_build=None, gap=1e-3):
+    # finds entities on cutout drawing layers that can't reach the outline they get cut from (the first drawing layer) in any
+    # of the instructions that use them, allowing for them and the outline both being placed at any of the array positions
+    # only plain cutout layers are considered, ones also used as outlines, edge cases, edm dents, or with an angle, emboss
+    # or loft are left alone, returns {layer: [entity numbers worth keeping]} for the layers where some can be dropped
+    # entities making up one loop between them (open rings whose ends meet within gap, see PolygonStore.loops()) are kept
+    # or dropped together, so no opening is left half drawn
+    if to_build is None:
+        to_build = [""]
+    uses = {}
+    untouchable = set()
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            continue
+        for layer in instruction["layers"]:
+            names = layer["drawing_layer_names"]
+            for key in ("edge_case", "edm_dent"):
+                if key in layer:
+                    untouchable.add(layer[key])
+            for name in names:
+                if isinstance(name, tuple):
+                    untouchable.update(part for part in name if isinstance(part, str))
+            cutouts = [name for name in names[1:] if isinstance(name, str)]
+            outline = names[0] if names else None
+            if isinstance(outline, str):
+                untouchable.add(outline)
+            # an outline with entities of unknown extent could reach further than its bbox says
+            if not isinstance(outline, str) or outline not in index or index[outline]["bbox"] is None or None in index[outline]["entity_bboxes"]:
+                untouchable.update(cutouts)
+                continue
+            offsets = [(0.0, 0.0)] + [(x, y) for x, y, *_ in layer.get("array", [])]
+            # the outline at every array position, as seen from every position the cutouts can be at
+            reach = placed_boxes(placed_boxes([index[outline]["bbox"]], offsets), [(-x, -y) for x, y in offsets])
+            for name in cutouts:
+                uses.setdefault(name, []).append(reach)
+
+    cache = SourceCache(cache_dir)
+    keep = {}
+    for name, targets in uses.items():
+        if name in untouchable or name not in index:
+            continue
+        boxes = sorted({tuple(box) for reach in targets for box in reach.tolist()})
+        wanted = reaching(cache, index[name], name, boxes, gap)
+        if not wanted:
+            # one stays so the layer still exists, cutting it away from the outline changes nothing
+            wanted = {0}
+        if len(wanted) < len(index[name]["entity_bboxes"]):
+            keep[name] = sorted(wanted)
+    return keep
+
+
+def reaching(cache, entry, name, boxes, gap=1e-3):
+    # the set of entity numbers in a drawing layer's index entry that might reach into any of the boxes: ones whose bbox
+    # overlaps one, ones of unknown extent and every other entity of a loop (see PolygonStore.loops()) any of those are in
+    bboxes = entry["entity_bboxes"]
+    tree = STRTree(bboxes)
+    wanted = {i for i, bbox in enumerate(bboxes) if bbox is None}
+    for box in boxes:
+        wanted.update(tree.query(box))
+    store = cache.layer_store(entry, name)
+    members = {}
+    for loop, entity in zip(store.loops(gap).tolist(), store.entities.tolist()):
+        members.setdefault(loop, set()).add(entity)
+    grown = True
+    while grown:
+        grown = False
+        for entities in members.values():
+            if not entities <= wanted and entities & wanted:
+                wanted |= entities
+                grown = True
+    return wanted
+
+
+def classify_tiles(cache_dir, index, instructions, to_build=None, keep=None, tolerance=1e-3):
+    # sorts the array positions of every arrayed layer with an edge_case into ones where the layer's cutouts sit clear
+    # inside the edge_case region, clear outside it or touching its edge, only the last need the edge case handled
+    # returns {instruction name: {layer name: ["inside" | "outside" | "edge" for each array position]}}
+    if to_build is None:
+        to_build = [""]
+    if keep is None:
+        keep = {}
+    cache = SourceCache(cache_dir)
+    stores = {}
+    classes = {}
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            continue
+        for layer in instruction["layers"]:
+            edge_case = layer.get("edge_case")
+            if edge_case not in index or not layer.get("array"):
+                continue
+            # the box around all of the layer's cutouts, as far as they're kept
+            tile = None
+            unknown = False
+            for drawing_layer in layer["drawing_layer_names"][1:]:
+                for name in drawing_layer if isinstance(drawing_layer, tuple) else [drawing_layer]:
+                    if isinstance(name, str) and name in index:
+                        bboxes = index[name]["entity_bboxes"]
+                        for i in keep.get(name, range(len(bboxes))):
+                            tile = merge_bbox(tile, bboxes[i])
+                            unknown |= bboxes[i] is None
+            if unknown:
+                # cutouts of unknown extent could touch the edge anywhere
+                classes.setdefault(instruction["name"], {})[layer["name"]] = ["edge"] * len(layer["array"])
+                continue
+            if tile is None:
+                continue
+            if edge_case not in stores:
+                stores[edge_case] = cache.layer_store(index[edge_case], edge_case)
+            boxes = placed_boxes([tile], layer["array"])
+            codes = stores[edge_case].classify_boxes(boxes, tolerance)
+            classes.setdefault(instruction["name"], {})[layer["name"]] = [("outside", "inside", "edge")[code] for code in codes]
+    return classes
+
+
+def loft_pairs(cache_dir, index, instructions, to_build=None, keep=None):
+    # pairs up the openings of the two drawing layers in every (layer, loft layer) entry, see pair_rings()
+    # returns {(layer, loft layer): {"pairs": [(ring, ring), ...], "unpaired": ([rings], [rings]), "ruled": [pairs with
+    # the same number of vertices at both ends, which can be lofted with plain ruled faces]}}
+    if to_build is None:
+        to_build = [""]
+    if keep is None:
+        keep = {}
+    cache = SourceCache(cache_dir)
+    found = {}
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            continue
+        for layer in instruction["layers"]:
+            for drawing_layer in layer["drawing_layer_names"]:
+                if not isinstance(drawing_layer, tuple) or not isinstance(drawing_layer[1], str) or drawing_layer in found:
+                    continue
+                if not all(name in index for name in drawing_layer):
+                    continue
+                a, b = (cache.layer_store(index[name], name, keep.get(name)) for name in drawing_layer)
+                pairs, unpaired_a, unpaired_b = pair_rings(a, b)
+                ruled = [(i, j) for i, j in pairs if a.ring_offsets[i + 1] - a.ring_offsets[i] == b.ring_offsets[j + 1] - b.ring_offsets[j]]
+                found[drawing_layer] = {"pairs": pairs, "unpaired": (unpaired_a, unpaired_b), "ruled": ruled}
+    return found
+
+
+def congruent_features(cache_dir, index, instructions, to_build=None, keep=None, grid=1e-6):
+    # how many distinct shapes the openings on the cutout drawing layers of the instructions come in, see
+    # PolygonStore.congruent(), returns {layer: {key: [(ring, x, y) for every copy]}}
+    if to_build is None:
+        to_build = [""]
+    if keep is None:
+        keep = {}
+    cache = SourceCache(cache_dir)
+    cutouts = set()
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            continue
+        for layer in instruction["layers"]:
+            for drawing_layer in layer["drawing_layer_names"][1:]:
+                cutouts.update(name for name in (drawing_layer if isinstance(drawing_layer, tuple) else [drawing_layer]) if isinstance(name, str) and name in index)
+    return {name: cache.layer_store(index[name], name, keep.get(name)).congruent(grid) for name in sorted(cutouts)}
+
+
+def flatten_layers(cache_dir, manifests, index, instructions, to_build=None, gap=1e-3):
+    # the 2d first mode: instruction layers that are just an outline less some cutouts (no array, edge case, edm dent, angle,
+    # emboss or loft) get their cutouts taken out in 2d and become a single drawing layer holding the outline with the
+    # cutouts as holes (even-odd), so there's one extrusion and no cut left to do
+    # that's only done where it needs no clipping, every cutout sitting clear inside the outline and clear of the others
+    # or clear inside one as an island (see PolygonStore.containment()),
+    # layers that need more than that are left as they are, cutout entities that can't reach the outline are left out as
+    # worked out from that outline alone (with gap for telling loops apart like prune_tools()), what prune_tools() keeps
+    # depends on the other instructions being built alongside
+    # returns instructions, manifests and index to carry on with in place of the given ones
+    if to_build is None:
+        to_build = [""]
+    cache = SourceCache(cache_dir)
+    manifests = {manifest["source"]: {**manifest, "layers": dict(manifest["layers"])} for manifest in manifests}
+    index = dict(index)
+    flattened = {}
+
+    def flatten(names):
+        outline, *cutouts = names
+        source = index[outline]["source"]
+        manifest = manifests[source]
+        # LWPOLYLINE needs R14 or later
+        if manifest["dxfversion"] <= "AC1009":
+            return None
+        keep = {}
+        if index[outline]["bbox"] is not None and None not in index[outline]["entity_bboxes"]:
+            for name in cutouts:
+                numbers = reaching(cache, index[name], name, [index[outline]["bbox"]], gap)
+                if len(numbers) < len(index[name]["entity_bboxes"]):
+                    keep[name] = sorted(numbers)
+        stores = [cache.layer_store(index[name], name, keep.get(name)) for name in names]
+        # the new layer only holds outlines, so entities entity_rings() doesn't understand (ellipses, splines, hatches,
+        # inserts, 3d polylines) would get lost
+        if any(set(store.entities.tolist()) != set(keep.get(name, range(len(index[name]["entity_bboxes"])))) for name, store in zip(names, stores)):
+            return None
+        body = stores[0]
+        tools = PolygonStore.concat(stores[1:])
+        if not body.closed.any() or not body.closed.all() or not tools.closed.all():
+            return None
+        bboxes = [tuple(bbox) for bbox in tools.ring_bboxes()]
+        if (body.classify_boxes(bboxes) != 1).any():
+            return None
+        # cutouts can hold islands, rings nested clear inside another come out right with even-odd, ones that cross or
+        # overlap without nesting would need clipping
+        parent, _ = tools.containment()
+        rings = tools.rings()
+
+        def nested(i, j):
+            k = parent[i]
+            while k != -1 and k != j:
+                k = parent[k]
+            return k == j and PolygonStore.from_rings({"": [rings[j]]}).classify_boxes([bboxes[i]])[0] == 1
+
+        tree = STRTree(bboxes)
+        if any(not (nested(i, j) or nested(j, i)) for i, bbox in enumerate(bboxes) for j in tree.query(bbox) if j != i):
+            return None
+        name = f"{outline}_2d_{digest(json.dumps([[index[name]['hash'], keep.get(name)] for name in names]).encode())[:8]}"
+        head = add_layer(cache.get(manifest["head"]), outline, name)
+        if head is None:
+            return None
+        manifest["head"] = cache.put(head)
+        manifest["layers"][name] = cache.entry(ring_entities(name, body.rings() + tools.rings()))
+        index[name] = {**manifest["layers"][name], "source": source}
+        return name
+
+    flat = []
+    for instruction in instructions:
+        if to_build != [""] and instruction["name"] not in to_build:
+            flat.append(instruction)
+            continue
+        layers = []
+        for layer in instruction["layers"]:
+            names = tuple(layer["drawing_layer_names"])
+            if len(names) > 1 and all(isinstance(name, str) and name in index for name in names) and not any(key in layer for key in ("array", "edge_case", "edm_dent")):
+                if names not in flattened:
+                    flattened[names] = flatten(names)
+                if flattened[names]:
+                    layer = {**layer, "drawing_layer_names": [flattened[names]]}
+            layers.append(layer)
+        flat.append({**instruction, "layers": layers})
+    done = sum(1 for name in flattened.values() if name)
+    if flattened:
+        print(f"Flattened {done} of {len(flattened)} outline and cutout combinations to single drawing layers")
+    return flat, list(manifests.values()), index
+
+
+def index_sources(sources, cache_dir, instructions=None, to_build=None, nparallel=1, heal=None, diagnostics=False):
+    # the first half of prepare_sources(): scans, indexes, heals and prunes the drawing layers, warning about anything off
+    # with diagnostics it also warns about loft openings with nothing to loft to, which takes its own pass over them
+    # returns the manifests, the index, the drawing layers that are wanted and what prune_tools() keeps of them
+    cache = SourceCache(cache_dir)
+    layers = None if instructions is None else referenced_layers(instructions, [""] if to_build is None else to_build)
+    manifests = load_sources(sources, cache_dir, layers=layers, nparallel=nparallel)
+    index, shadowed = index_layers(manifests)
+    if layers is None:
+        layers = set(index)
+    elif layers - index.keys():
+        print(f"Warning: drawing layers not found in any source: {sorted(layers - index.keys())}")
+    for name in sorted(layers.intersection(shadowed)):
+        print(f"Warning: drawing layer {name} is defined in {', '.join(Path(source).name for source in shadowed[name])}, using the one from {Path(shadowed[name][0]).name}")
+    if heal is not None:
+        versions = {manifest["source"]: manifest["dxfversion"] for manifest in manifests}
+        for name in sorted(layers.intersection(index)):
+            # LWPOLYLINE needs R14 or later
+            if versions[index[name]["source"]] > "AC1009":
+                index[name], changes = cache.heal(index[name], name, heal)
+                if changes:
+                    print(f"Healed drawing layer {name}: {', '.join(f'{n} {what}' for what, n in changes.items() if n)}")
+    # loops are told apart the way healing chains them
+    keep = {} if instructions is None else prune_tools(cache_dir, index, instructions, to_build, (heal or {}).get("gap", 1e-3))
+    for name, numbers in sorted(keep.items()):
+        print(f"Dropping {len(index[name]['entity_bboxes']) - len(numbers)} entities from drawing layer {name} that can't reach its outline")
+    if diagnostics and instructions is not None:
+        for (name, loft), found in sorted(loft_pairs(cache_dir, index, instructions, to_build, keep).items()):
+            unpaired_a, unpaired_b = found["unpaired"]
+            if unpaired_a or unpaired_b:
+                print(f"Warning: {len(unpaired_a)} openings on drawing layer {name} and {len(unpaired_b)} on {loft} have nothing to loft to")
+    return manifests, index, layers, keep
+
+
+def assemble_sources(cache_dir, manifests, index, layers, keep):
+    # the second half of prepare_sources(): the drawings holding the given drawing layers, from what index_sources() gave
+    cache = SourceCache(cache_dir)
+    drawings = []
+    for manifest in manifests:
+        wanted = {name for name in layers.intersection(manifest["layers"]) if index[name]["source"] == manifest["source"]}
+        if wanted:
+            drawings.append(cache.drawing(manifest, wanted, {name: keep[name] for name in wanted if name in keep}, {name: index[name] for name in wanted}))
+    return drawings
+
+
+def prepare_sources(sources, cache_dir, instructions=None, to_build=None, nparallel=1, heal=None):
+    # returns paths to drawings assembled from the cache that can stand in for the given sources
+    # when instructions are given the drawings only hold the drawing layers the ones in to_build (None for all) reference,
+    # less any cutout entities that prune_tools() finds can't touch their outline, and sources without any of them are left out
+    # each drawing layer only goes into the drawing for the source that wins it in index_layers()
+    # heal can be a dict of PolygonStore.healed() options to clean up the outlines of the drawing layers going in
+    return assemble_sources(cache_dir, *index_sources(sources, cache_dir, instructions, to_build, nparallel, heal))
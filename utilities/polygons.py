@@ -0,0 +1,694 @@
+#!/usr/bin/env python3
+
+# 2d geometry for the drawing layers in the sources
+# outlines are kept the way dxf keeps them, as rings of vertices where each vertex has a bulge that turns the segment
+# starting there into a circular arc, so nothing gets approximated and circles are just two vertices with a bulge of 1
+
+import math
+
+import numpy as np
+
+
+def arc_bbox(cx, cy, r, start, sweep):
+    # exact bounding box of a circular arc going counterclockwise from angle start (radians) through sweep
+    if sweep < 0:
+        start, sweep = start + sweep, -sweep
+    angles = [start, start + sweep]
+    # axis extremes the arc passes through
+    k = math.ceil(start / (math.pi / 2))
+    while k * math.pi / 2 < start + sweep:
+        angles.append(k * math.pi / 2)
+        k += 1
+    xs = [cx + r * math.cos(a) for a in angles]
+    ys = [cy + r * math.sin(a) for a in angles]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def bulge_arc(x1, y1, x2, y2, bulge):
+    # (center x, center y, radius, start angle, sweep) of the arc a polyline bulge describes
+    sweep = 4 * math.atan(bulge)
+    chord = math.hypot(x2 - x1, y2 - y1)
+    r = chord / (2 * math.sin(abs(sweep) / 2))
+    d = r * math.cos(sweep / 2) * math.copysign(1, bulge)
+    cx = (x1 + x2) / 2 - d * (y2 - y1) / chord
+    cy = (y1 + y2) / 2 + d * (x2 - x1) / chord
+    return cx, cy, r, math.atan2(y1 - cy, x1 - cx), sweep
+
+
+def merge_bbox(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def bboxes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def placed_boxes(boxes, offsets):
+    # (offsets * boxes, 4) copies of the xmin, ymin, xmax, ymax boxes moved to each of the (x, y[, z]) offsets, like an
+    # instruction's "array", the copies for the first offset first
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    offsets = np.asarray([offset[:2] for offset in offsets], dtype=np.float64).reshape(-1, 2)
+    return (boxes[None, :, :] + np.tile(offsets, 2)[:, None, :]).reshape(-1, 4)
+
+
+class STRTree(object):
+    # sort-tile-recursive packed r-tree for finding which of a bunch of bounding boxes overlap a query box
+
+    def __init__(self, bboxes, capacity=16):
+        self.capacity = capacity
+        # a node is (bbox, children) and a leaf is (bbox, item number)
+        level = [(bbox, i) for i, bbox in enumerate(bboxes) if bbox is not None]
+        while len(level) > capacity:
+            level = self._pack(level)
+        self.root = (self._cover(level), level) if level else None
+
+    def _cover(self, nodes):
+        bbox = None
+        for node in nodes:
+            bbox = merge_bbox(bbox, node[0])
+        return bbox
+
+    def _pack(self, nodes):
+        # tiles the nodes into vertical slices by x then fills parents bottom to top by y
+        n_parents = math.ceil(len(nodes) / self.capacity)
+        n_slices = math.ceil(math.sqrt(n_parents))
+        per_slice = n_slices * self.capacity
+        nodes = sorted(nodes, key=lambda node: node[0][0] + node[0][2])
+        parents = []
+        for i in range(0, len(nodes), per_slice):
+            column = sorted(nodes[i : i + per_slice], key=lambda node: node[0][1] + node[0][3])
+            for j in range(0, len(column), self.capacity):
+                children = column[j : j + self.capacity]
+                parents.append((self._cover(children), children))
+        return parents
+
+    def query(self, bbox):
+        # the item numbers whose bounding boxes overlap the given one
+        found = []
+        stack = [self.root] if self.root is not None and bboxes_overlap(self.root[0], bbox) else []
+        while stack:
+            for child in stack.pop()[1]:
+                if bboxes_overlap(child[0], bbox):
+                    if isinstance(child[1], list):
+                        stack.append(child)
+                    else:
+                        found.append(child[1])
+        return found
+
+
+class PolygonStore(object):
+    # the rings of a set of drawing layers packed into contiguous arrays:
+    # coords (n, 2) and bulges (n,) for every vertex, ring_offsets (rings + 1,) into those, closed (rings,) and
+    # entities (rings,) the entity number within its layer each ring came from, and layer_offsets (layers + 1,) into the rings
+    # so transforming or measuring whole layers is a handful of numpy operations and pickling one is just copying buffers
+
+    def __init__(self, names, coords, bulges, ring_offsets, closed, entities, layer_offsets):
+        self.names = list(names)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.bulges = np.asarray(bulges, dtype=np.float64)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.closed = np.asarray(closed, dtype=bool)
+        self.entities = np.asarray(entities, dtype=np.int64)
+        self.layer_offsets = np.asarray(layer_offsets, dtype=np.int64)
+
+    @classmethod
+    def from_rings(cls, layers):
+        # layers is {name: [(vertices [(x, y), ...], bulges [...], closed, entity number), ...]}
+        names = []
+        coords = []
+        bulges = []
+        ring_offsets = [0]
+        closed = []
+        entities = []
+        layer_offsets = [0]
+        for name, rings in layers.items():
+            names.append(name)
+            for vertices, ring_bulges, ring_closed, entity in rings:
+                coords.extend(vertices)
+                bulges.extend(ring_bulges)
+                ring_offsets.append(len(bulges))
+                closed.append(ring_closed)
+                entities.append(entity)
+            layer_offsets.append(len(closed))
+        return cls(names, coords, bulges, ring_offsets, closed, entities, layer_offsets)
+
+    @classmethod
+    def concat(cls, stores):
+        stores = list(stores)
+        if not stores:
+            return cls.from_rings({})
+        vertex_starts = np.cumsum([0] + [len(store.bulges) for store in stores])
+        ring_starts = np.cumsum([0] + [len(store.closed) for store in stores])
+        return cls(
+            [name for store in stores for name in store.names],
+            np.concatenate([store.coords for store in stores]),
+            np.concatenate([store.bulges for store in stores]),
+            np.concatenate([[0]] + [store.ring_offsets[1:] + start for store, start in zip(stores, vertex_starts)]),
+            np.concatenate([store.closed for store in stores]),
+            np.concatenate([store.entities for store in stores]),
+            np.concatenate([[0]] + [store.layer_offsets[1:] + start for store, start in zip(stores, ring_starts)]),
+        )
+
+    def __len__(self):
+        return len(self.closed)
+
+    def layer_rings(self, name):
+        # the range of ring numbers that make up a drawing layer
+        i = self.names.index(name)
+        return range(self.layer_offsets[i], self.layer_offsets[i + 1])
+
+    def ring_of_vertex(self):
+        # (n,) which ring every vertex is in
+        return np.repeat(np.arange(len(self.closed)), np.diff(self.ring_offsets))
+
+    def next_vertex(self):
+        # (n,) index of the vertex every segment ends at, wrapping around within each ring
+        following = np.arange(1, len(self.bulges) + 1)
+        following[self.ring_offsets[1:] - 1] = self.ring_offsets[:-1]
+        return following
+
+    def segments(self):
+        # every segment of every ring decoded in one go, a dict of arrays with one row per vertex:
+        # "start" and "end" (n, 2), "bulge", "ring", "exists" (open rings have no segment leaving their last vertex),
+        # "arc" (exists with a bulge and a length) and for arcs "center" (n, 2), "radius", "angle" (where it starts) and "sweep"
+        following = self.next_vertex()
+        rings = self.ring_of_vertex()
+        start = self.coords
+        end = self.coords[following]
+        exists = self.closed[rings] | (following != self.ring_offsets[:-1][rings])
+        delta = end - start
+        chord = np.hypot(delta[:, 0], delta[:, 1])
+        arc = exists & (self.bulges != 0) & (chord > 0)
+
+        sweep = np.where(arc, 4 * np.arctan(self.bulges), 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            radius = np.where(arc, chord / (2 * np.sin(np.abs(sweep) / 2)), np.nan)
+            # distance from the chord's middle to the center, along the chord's left normal
+            d = radius * np.cos(sweep / 2) * np.sign(self.bulges) / chord
+        center = (start + end) / 2 + d[:, None] * np.column_stack((-delta[:, 1], delta[:, 0]))
+        angle = np.arctan2(start[:, 1] - center[:, 1], start[:, 0] - center[:, 0])
+        return {"start": start, "end": end, "bulge": self.bulges, "ring": rings, "exists": exists, "arc": arc, "center": center, "radius": radius, "angle": angle, "sweep": sweep}
+
+    def ring_bboxes(self):
+        # (rings, 4) exact xmin, ymin, xmax, ymax of every ring, arcs included
+        bboxes = np.empty((len(self.closed), 4))
+        if len(self.closed) == 0:
+            return bboxes
+        starts = self.ring_offsets[:-1]
+        bboxes[:, 0] = np.minimum.reduceat(self.coords[:, 0], starts)
+        bboxes[:, 1] = np.minimum.reduceat(self.coords[:, 1], starts)
+        bboxes[:, 2] = np.maximum.reduceat(self.coords[:, 0], starts)
+        bboxes[:, 3] = np.maximum.reduceat(self.coords[:, 1], starts)
+
+        # arcs can bulge past their ends, at the axis extremes they sweep through
+        seg = self.segments()
+        arc = seg["arc"]
+        if not arc.any():
+            return bboxes
+        cx, cy = seg["center"][arc].T
+        r = seg["radius"][arc]
+        sweep = seg["sweep"][arc]
+        first = np.where(sweep < 0, seg["angle"][arc] + sweep, seg["angle"][arc])  # counterclockwise from here
+        sweep = np.abs(sweep)
+        rings = seg["ring"][arc]
+        for column, extreme, value in ((2, 0.0, cx + r), (3, np.pi / 2, cy + r), (0, np.pi, cx - r), (1, 3 * np.pi / 2, cy - r)):
+            reached = np.mod(extreme - first, 2 * np.pi) <= sweep
+            if column < 2:
+                np.minimum.at(bboxes[:, column], rings[reached], value[reached])
+            else:
+                np.maximum.at(bboxes[:, column], rings[reached], value[reached])
+        return bboxes
+
+    def flattened(self, tolerance=1e-3):
+        # the same rings with every arc swapped for straight segments that stray no further than tolerance from it
+        seg = self.segments()
+        arc = seg["arc"]
+        counts = np.ones(len(self.bulges), dtype=np.int64)
+        with np.errstate(invalid="ignore"):
+            step = 2 * np.arccos(np.clip(1 - tolerance / seg["radius"][arc], -1, 1))
+        counts[arc] = np.maximum(1, np.ceil(np.abs(seg["sweep"][arc]) / np.where(step > 0, step, np.pi / 2))).astype(np.int64)
+
+        # each vertex is followed by the points inside the arc leaving it
+        owner = np.repeat(np.arange(len(counts)), counts)
+        sub = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        coords = self.coords[owner]
+        inner = sub > 0
+        o = owner[inner]
+        angle = seg["angle"][o] + seg["sweep"][o] * sub[inner] / counts[o]
+        coords[inner] = seg["center"][o] + seg["radius"][o, None] * np.column_stack((np.cos(angle), np.sin(angle)))
+        ring_offsets = np.concatenate([[0], np.cumsum(np.add.reduceat(counts, self.ring_offsets[:-1]))]) if len(self.closed) else np.zeros(1, dtype=np.int64)
+        return PolygonStore(self.names, coords, np.zeros(len(coords)), ring_offsets, self.closed, self.entities, self.layer_offsets)
+
+    def ring_areas(self, tolerance=1e-3):
+        # (rings,) unsigned area enclosed by every ring, open ones count as if closed straight back to their start
+        flat = self.flattened(tolerance)
+        following = flat.next_vertex()
+        x, y = flat.coords.T
+        cross = x * y[following] - x[following] * y
+        if len(flat.closed) == 0:
+            return np.zeros(0)
+        return np.abs(np.add.reduceat(cross, flat.ring_offsets[:-1])) / 2
+
+    def ring_centroids(self, tolerance=1e-3):
+        # (rings, 2) area centroid of every ring, open ones count as if closed straight back to their start
+        flat = self.flattened(tolerance)
+        if len(flat.closed) == 0:
+            return np.zeros((0, 2))
+        following = flat.next_vertex()
+        x, y = flat.coords.T
+        xn, yn = flat.coords[following].T
+        cross = x * yn - xn * y
+        starts = flat.ring_offsets[:-1]
+        area = np.add.reduceat(cross, starts) / 2
+        cx = np.add.reduceat((x + xn) * cross, starts)
+        cy = np.add.reduceat((y + yn) * cross, starts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centroids = np.column_stack((cx, cy)) / (6 * area[:, None])
+        # rings without area fall back to the average of their vertices
+        flat_rings = ~np.isfinite(centroids).all(axis=1) | (np.abs(area) < tolerance * tolerance)
+        if flat_rings.any():
+            counts = np.diff(flat.ring_offsets)
+            mean = np.column_stack((np.add.reduceat(x, starts), np.add.reduceat(y, starts))) / counts[:, None]
+            centroids[flat_rings] = mean[flat_rings]
+        return centroids
+
+    def containment(self, tolerance=1e-3, block=1024):
+        # how the closed rings nest, for telling outlines from holes and islands inside holes
+        # returns (parent, depth) arrays over all rings: parent is the smallest closed ring around a ring (-1 for none) and
+        # depth is how many closed rings are around it, so with even-odd filling even depths are material and odd ones holes
+        # open rings get parent -1 and depth -1, rings are compared by a vertex so ones that cross each other aren't sorted out
+        n = len(self.closed)
+        parent = np.full(n, -1, dtype=np.int64)
+        depth = np.where(self.closed, 0, -1)
+        closed = np.flatnonzero(self.closed)
+        if len(closed) < 2:
+            return parent, depth
+        flat = self.flattened(tolerance)
+        bboxes = self.ring_bboxes()[closed]
+        areas = self.ring_areas(tolerance)[closed]
+
+        # candidate pairs are child rings whose bounding box fits inside a bigger ring's, done in blocks to keep memory down
+        children = []
+        parents = []
+        for i in range(0, len(closed), block):
+            b = bboxes[i : i + block]
+            fits = (b[:, None, 0] >= bboxes[None, :, 0]) & (b[:, None, 1] >= bboxes[None, :, 1]) & (b[:, None, 2] <= bboxes[None, :, 2]) & (b[:, None, 3] <= bboxes[None, :, 3])
+            fits &= areas[i : i + block, None] < areas[None, :]
+            c, p = np.nonzero(fits)
+            children.append(c + i)
+            parents.append(p)
+        children = np.concatenate(children)
+        parents = np.concatenate(parents)
+        if len(children) == 0:
+            return parent, depth
+
+        # even-odd point in polygon test of each child's first vertex against all of its candidate's edges at once,
+        # in batches of pairs holding about block * 1024 edges
+        following = flat.next_vertex()
+        lengths = flat.ring_offsets[closed[parents] + 1] - flat.ring_offsets[closed[parents]]
+        batch = np.searchsorted(np.cumsum(lengths), np.arange(0, lengths.sum(), block * 1024), side="right")
+        inside = np.zeros(len(children), dtype=bool)
+        for a, b in zip(batch, [*batch[1:], len(children)]):
+            b = max(b, a + 1)
+            point = flat.coords[flat.ring_offsets[closed[children[a:b]]]]
+            starts = flat.ring_offsets[closed[parents[a:b]]]
+            n_edges = lengths[a:b]
+            pair = np.repeat(np.arange(b - a), n_edges)
+            edge = np.repeat(starts - np.cumsum(np.concatenate([[0], n_edges[:-1]])), n_edges) + np.arange(n_edges.sum())
+            x1, y1 = flat.coords[edge].T
+            x2, y2 = flat.coords[following[edge]].T
+            px, py = point[pair].T
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crosses = straddles & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+            inside[a:b] = np.bincount(pair, weights=crosses, minlength=b - a) % 2 == 1
+        children = children[inside]
+        parents = parents[inside]
+        if len(children) == 0:
+            return parent, depth
+
+        depth[closed] = np.bincount(children, minlength=len(closed))
+        # the smallest ring around each child is its parent
+        order = np.lexsort((areas[parents], children))
+        children = children[order]
+        parents = parents[order]
+        first = np.concatenate([[True], children[1:] != children[:-1]])
+        parent[closed[children[first]]] = closed[parents[first]]
+        return parent, depth
+
+
+    def classify_boxes(self, boxes, tolerance=1e-3):
+        # where each of the (n, 4) xmin, ymin, xmax, ymax boxes sits against the region the closed rings fill (even-odd):
+        # 0 clear outside it, 1 clear inside it and 2 touching its edge, a box touches when it overlaps the bounding box of
+        # a boundary segment (grown by tolerance), so a near miss can come out as 2 but a crossing never comes out as 0 or 1
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        seg = self.flattened(tolerance).segments()
+        start = seg["start"][seg["exists"]]
+        end = seg["end"][seg["exists"]]
+        low = np.minimum(start, end) - tolerance
+        high = np.maximum(start, end) + tolerance
+        touching = ((boxes[:, None, 0] <= high[None, :, 0]) & (low[None, :, 0] <= boxes[:, None, 2]) & (boxes[:, None, 1] <= high[None, :, 1]) & (low[None, :, 1] <= boxes[:, None, 3])).any(axis=1)
+
+        # boxes clear of the edge are all in or all out, like their middles, which get an even-odd test
+        edges = seg["exists"] & self.closed[seg["ring"]]
+        x1, y1 = seg["start"][edges].T
+        x2, y2 = seg["end"][edges].T
+        px = (boxes[:, 0, None] + boxes[:, 2, None]) / 2
+        py = (boxes[:, 1, None] + boxes[:, 3, None]) / 2
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crosses = straddles & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+        inside = crosses.sum(axis=1) % 2 == 1
+        return np.where(touching, 2, np.where(inside, 1, 0))
+
+    def congruent(self, grid=1e-6, tolerance=1e-3):
+        # groups the rings that are translated copies of each other, the same within grid once moved to put their
+        # centroid on the origin, wherever a closed ring starts and whichever way it goes (see ring_key())
+        # returns {key: [(ring, x, y) for every copy, x and y being where its centroid sits]}
+        shapes = {}
+        centroids = self.ring_centroids(tolerance)
+        for i, (coords, bulges, closed, _) in enumerate(self.rings()):
+            x, y = centroids[i]
+            key = ring_key([(px - x, py - y) for px, py in coords], bulges, closed, grid)
+            shapes.setdefault(key, []).append((i, float(x), float(y)))
+        return shapes
+
+    def loops(self, gap=1e-3):
+        # (rings,) a loop number for every ring, open rings whose ends meet within gap (the ones healed() would chain
+        # together) share one, closed rings are a loop each
+        loop = list(range(len(self.closed)))
+
+        def root(i):
+            while loop[i] != i:
+                loop[i] = loop[loop[i]]
+                i = loop[i]
+            return i
+
+        rings = np.flatnonzero(~self.closed)
+        ends = np.concatenate([self.coords[self.ring_offsets[rings]], self.coords[self.ring_offsets[rings + 1] - 1]])
+        owners = np.concatenate([rings, rings])
+        tree = STRTree([(x - gap, y - gap, x + gap, y + gap) for x, y in ends.tolist()])
+        for (x, y), owner in zip(ends.tolist(), owners.tolist()):
+            for j in tree.query((x, y, x, y)):
+                if math.hypot(ends[j, 0] - x, ends[j, 1] - y) <= gap:
+                    loop[root(owner)] = root(int(owners[j]))
+        return np.array([root(i) for i in range(len(loop))], dtype=np.int64)
+
+    def rings(self, layer=None):
+        # [(coords, bulges, closed, entity number), ...] as plain lists for the rings of a drawing layer (or all of them)
+        numbers = range(len(self.closed)) if layer is None else self.layer_rings(layer)
+        return [(self.coords[self.ring_offsets[i] : self.ring_offsets[i + 1]].tolist(), self.bulges[self.ring_offsets[i] : self.ring_offsets[i + 1]].tolist(), bool(self.closed[i]), int(self.entities[i])) for i in numbers]
+
+    def healed(self, gap=1e-3, collinear=1e-6, duplicate=1e-6, primitives=None):
+        # a cleaned up copy for the mess cad edits leave behind, done layer by layer:
+        # exact and near (within duplicate) duplicate rings are dropped, open rings whose ends meet within gap are chained
+        # together and closed up, zero length segments and vertices within collinear of a straight run are removed
+        # with primitives (a distance) runs of segments that stay within it of one circle or line become a single arc or
+        # straight segment and rings that are all one circle become two vertex circles, see recognized()
+        # entity numbers of chained rings become -1, returns the new store and {layer: {what: how many}} for the layers that changed
+        layers = {}
+        report = {}
+        for name in self.names:
+            rings, changes = heal_rings(self.rings(name), gap, collinear, duplicate, primitives)
+            layers[name] = rings
+            if any(changes.values()):
+                report[name] = changes
+        return PolygonStore.from_rings(layers), report
+
+
+def pair_rings(a, b, tolerance=1e-3):
+    # matches up the closed rings of two stores that are the same openings drawn twice, like the two ends of a loft:
+    # a ring can only pair with rings whose bounding box overlaps its own, found with an STRTree, and pairs are made
+    # closest centroids first so each ring ends up in at most one pair
+    # returns [(ring in a, ring in b), ...] along with the rings of a and of b that found no partner
+    rings_a = np.flatnonzero(a.closed)
+    rings_b = np.flatnonzero(b.closed)
+    if len(rings_a) == 0 or len(rings_b) == 0:
+        return [], rings_a.tolist(), rings_b.tolist()
+    bboxes_a = a.ring_bboxes()
+    centroids_a = a.ring_centroids(tolerance)
+    centroids_b = b.ring_centroids(tolerance)
+    tree = STRTree([tuple(bbox) for bbox in b.ring_bboxes()[rings_b]])
+    candidates = []
+    for i in rings_a:
+        for k in tree.query(tuple(bboxes_a[i])):
+            j = rings_b[k]
+            candidates.append((math.hypot(*(centroids_a[i] - centroids_b[j])), int(i), int(j)))
+    pairs = []
+    taken_a = set()
+    taken_b = set()
+    for _, i, j in sorted(candidates):
+        if i not in taken_a and j not in taken_b:
+            pairs.append((i, j))
+            taken_a.add(i)
+            taken_b.add(j)
+    return sorted(pairs), [int(i) for i in rings_a if i not in taken_a], [int(j) for j in rings_b if j not in taken_b]
+
+
+def reversed_ring(coords, bulges):
+    # the same open ring walked the other way, each segment's bulge flips sign and moves to the segment's new start
+    return coords[::-1], [-b for b in bulges[-2::-1]] + [0.0]
+
+
+def ring_key(coords, bulges, closed, grid):
+    # a hashable key that's the same for rings that match within grid, wherever a closed ring starts and whichever way it goes
+    def snapped(c, b):
+        return tuple((round(x / grid), round(y / grid), round(bulge, 6)) for (x, y), bulge in zip(c, b))
+
+    if closed:
+        # walking a closed ring backwards, vertex k's bulge is the negated bulge of the segment before it
+        candidates = [snapped(coords, bulges), snapped(coords[::-1], [-b for b in bulges[-2::-1] + bulges[-1:]])]
+        candidates = [c[c.index(min(c)) :] + c[: c.index(min(c))] for c in candidates]
+    else:
+        candidates = [snapped(coords, bulges[:-1] + [0.0]), snapped(*reversed_ring(coords, bulges))]
+    return (closed, min(candidates))
+
+
+def heal_rings(rings, gap, collinear, duplicate, primitives=None):
+    # does PolygonStore.healed() for one layer's [(coords, bulges, closed, entity number), ...]
+    changes = {"duplicates removed": 0, "rings chained": 0, "gaps closed": 0, "vertices removed": 0, "circles found": 0, "arcs found": 0, "rectangles found": 0}
+
+    unique = []
+    seen = set()
+    for ring in rings:
+        key = ring_key(*ring[:3], duplicate)
+        if key in seen:
+            changes["duplicates removed"] += 1
+            continue
+        seen.add(key)
+        unique.append(ring)
+
+    def near(a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1]) <= gap
+
+    # chain open rings end to start, flipping them around where that's what makes them meet
+    closed_rings = [list(ring) for ring in unique if ring[2]]
+    open_rings = [list(ring) for ring in unique if not ring[2]]
+    chained = []
+    while open_rings:
+        coords, bulges, _, entity = open_rings.pop(0)
+        grown = True
+        while grown:
+            grown = False
+            for i, (other, other_bulges, _, _) in enumerate(open_rings):
+                if near(coords[-1], other[-1]):
+                    other, other_bulges = reversed_ring(other, other_bulges)
+                elif not near(coords[-1], other[0]):
+                    if near(coords[0], other[0]):
+                        coords, bulges = reversed_ring(coords, bulges)
+                    elif near(coords[0], other[-1]):
+                        coords, bulges = reversed_ring(coords, bulges)
+                        other, other_bulges = reversed_ring(other, other_bulges)
+                    else:
+                        continue
+                coords = coords + other[1:]
+                bulges = bulges[:-1] + other_bulges
+                entity = -1
+                open_rings.pop(i)
+                changes["rings chained"] += 1
+                grown = True
+                break
+        if len(coords) > 2 and near(coords[0], coords[-1]):
+            coords = coords[:-1]
+            bulges = bulges[:-1]
+            closed_rings.append([coords, bulges, True, entity])
+            changes["gaps closed"] += 1
+        else:
+            chained.append([coords, bulges, False, entity])
+
+    healed = []
+    for coords, bulges, closed, entity in closed_rings + chained:
+        n = len(coords)
+        coords, bulges = simplified(coords, bulges, closed, collinear)
+        if primitives is not None:
+            coords, bulges, found = recognized(coords, bulges, closed, primitives)
+            for what, count in found.items():
+                changes[what] += count
+        changes["vertices removed"] += n - len(coords)
+        healed.append((coords, bulges, closed, entity))
+    return healed, changes
+
+
+def simplified(coords, bulges, closed, tolerance):
+    # drops zero length segments and vertices that sit within tolerance of the straight line past them
+    kept = [list(coords[0])]
+    kept_bulges = [bulges[0]]
+    for i in range(1, len(coords)):
+        x, y = coords[i]
+        px, py = kept[-1]
+        if math.hypot(x - px, y - py) <= tolerance:
+            # the outgoing segment now starts at the vertex we already have
+            kept_bulges[-1] = bulges[i]
+            continue
+        kept.append([x, y])
+        kept_bulges.append(bulges[i])
+        # the previous vertex can go if it joins two straight segments in line with each other
+        if len(kept) >= 3 and kept_bulges[-3] == 0 and kept_bulges[-2] == 0 and in_line(kept[-3], kept[-2], kept[-1], tolerance):
+            del kept[-2]
+            del kept_bulges[-2]
+    if closed:
+        while len(kept) > 2 and math.hypot(kept[0][0] - kept[-1][0], kept[0][1] - kept[-1][1]) <= tolerance:
+            kept.pop()
+            kept_bulges.pop()
+        # the seam where the ring closes
+        while len(kept) > 3 and kept_bulges[-2] == 0 and kept_bulges[-1] == 0 and in_line(kept[-2], kept[-1], kept[0], tolerance):
+            kept.pop(-1)
+            kept_bulges.pop(-1)
+        while len(kept) > 3 and kept_bulges[-1] == 0 and kept_bulges[0] == 0 and in_line(kept[-1], kept[0], kept[1], tolerance):
+            kept.pop(0)
+            kept_bulges.pop(0)
+    return kept, kept_bulges
+
+
+def recognized(coords, bulges, closed, tolerance, min_segments=4):
+    # swaps runs of segments for the analytic shape they were drawn to be: a run that stays within tolerance of one circle
+    # becomes a single arc (straight only runs need min_segments segments for that), a straight only run that stays within
+    # tolerance of the line between its ends becomes one straight segment and a closed ring that goes once around one
+    # circle becomes a two vertex circle, see ring_circle()
+    # returns the new coords and bulges and {"circles found", "arcs found", "rectangles found": how many}
+    found = {"circles found": 0, "arcs found": 0, "rectangles found": 0}
+    n = len(coords)
+    if closed and n > 2:
+        fit = run_fit(coords, bulges, 0, n, tolerance)
+        if fit is not None and fit[0] == "circle":
+            _, cx, cy, r, sweep = fit
+            found["circles found"] += 1
+            return [[cx + r, cy], [cx - r, cy]], [math.copysign(1.0, sweep)] * 2, found
+        # start at a vertex that has to stay so no run gets cut in two by the seam, or where everything joins on smoothly
+        # (fillets running into straight sides) at the start of the longest segment, which is where some run starts
+        corners = [k for k in range(n) if run_fit(coords, bulges, k - 1, k + 1, tolerance) is None]
+        k = corners[0] if corners else max(range(n), key=lambda k: math.dist(coords[k], coords[(k + 1) % n]))
+        coords = [list(c) for c in coords[k:] + coords[:k]]
+        bulges = bulges[k:] + bulges[:k]
+    segments = n if closed else n - 1
+    kept = [list(coords[0])]
+    kept_bulges = []
+    i = 0
+    while i < segments:
+        best = None
+        j = i + 2
+        while j <= segments:
+            fit = run_fit(coords, bulges, i, j, tolerance)
+            if fit is None:
+                break
+            if fit[0] == "line" or fit[0] == "arc" and (any(bulges[k % n] for k in range(i, j)) or j - i >= min_segments):
+                best = (j, fit)
+            j += 1
+        if best is None:
+            kept_bulges.append(bulges[i])
+            i += 1
+        else:
+            j, fit = best
+            # the first segments of a fillet run on nearly straight from the side before it, they belong to the arc
+            while fit[0] == "line" and j - 1 > i and j - 1 + min_segments <= segments and starts_arc(coords, bulges, j - 1, min_segments, tolerance):
+                j -= 1
+            if fit[0] == "arc":
+                kept_bulges.append(math.tan(fit[4] / 4))
+                found["arcs found"] += 1
+            else:
+                kept_bulges.append(0.0)
+            i = j
+        kept.append(list(coords[i % n]))
+    if closed:
+        kept.pop()
+    else:
+        kept_bulges.append(bulges[-1])
+    if closed and n > 4 and len(kept) == 4 and not any(kept_bulges):
+        # four straight sides at right angles
+        sides = [(kept[(k + 1) % 4][0] - kept[k][0], kept[(k + 1) % 4][1] - kept[k][1]) for k in range(4)]
+        if all(abs(a[0] * b[0] + a[1] * b[1]) <= tolerance * math.hypot(*a) for a, b in zip(sides, sides[1:] + sides[:1])):
+            found["rectangles found"] += 1
+    return kept, kept_bulges, found
+
+
+def starts_arc(coords, bulges, i, min_segments, tolerance):
+    # whether the min_segments segments from vertex i make up an arc
+    fit = run_fit(coords, bulges, i, i + min_segments, tolerance)
+    return fit is not None and fit[0] == "arc"
+
+
+def run_fit(coords, bulges, i, j, tolerance):
+    # what the segments from vertex i to vertex j (indices wrap around the ring) stay within tolerance of, if anything:
+    # ("line",), ("arc", center x, center y, radius, sweep) or when they go all the way around ("circle", ...)
+    n = len(coords)
+    points = [coords[k % n] for k in range(i, j + 1)]
+    run = [bulges[k % n] for k in range(i, j)]
+    full = j - i == n
+    if not full and not any(run):
+        if all(in_line(points[0], point, points[-1], tolerance) for point in points[1:-1]):
+            return ("line",)
+    # the circle through three of the run's points, spread out
+    m = len(points) - 1
+    if m < 2:
+        return None
+    (ax, ay), (bx, by), (cx, cy) = (points[0], points[m // 3], points[2 * m // 3]) if full else (points[0], points[m // 2], points[m])
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    ox = ((ax * ax + ay * ay) * (by - cy) + (bx * bx + by * by) * (cy - ay) + (cx * cx + cy * cy) * (ay - by)) / d
+    oy = ((ax * ax + ay * ay) * (cx - bx) + (bx * bx + by * by) * (ax - cx) + (cx * cx + cy * cy) * (bx - ax)) / d
+    r = math.hypot(ax - ox, ay - oy)
+    sweep = 0.0
+    for (px, py), (qx, qy), bulge in zip(points, points[1:], run):
+        if abs(math.hypot(qx - ox, qy - oy) - r) > tolerance:
+            return None
+        if bulge:
+            acx, acy, ar, _, turn = bulge_arc(px, py, qx, qy, bulge)
+            if math.hypot(acx - ox, acy - oy) > tolerance or abs(ar - r) > tolerance:
+                return None
+        else:
+            # how far the middle of the straight segment sags inside the circle
+            if r - math.hypot((px + qx) / 2 - ox, (py + qy) / 2 - oy) > tolerance:
+                return None
+            turn = math.atan2((px - ox) * (qy - oy) - (py - oy) * (qx - ox), (px - ox) * (qx - ox) + (py - oy) * (qy - oy))
+        if turn == 0 or sweep and (turn > 0) != (sweep > 0):
+            return None
+        sweep += turn
+    if full:
+        return ("circle", ox, oy, r, sweep) if abs(abs(sweep) - 2 * math.pi) < 1e-6 else None
+    if abs(sweep) >= 2 * math.pi - 1e-6:
+        return None
+    return ("arc", ox, oy, r, sweep)
+
+
+def ring_circle(coords, bulges, closed):
+    # (center x, center y, radius) when the ring is a circle, a closed ring of two vertices with the same bulge of 1 or -1
+    if closed and len(coords) == 2 and abs(abs(bulges[0]) - 1) < 1e-9 and abs(bulges[0] - bulges[1]) < 1e-9:
+        (x1, y1), (x2, y2) = coords
+        return (x1 + x2) / 2, (y1 + y2) / 2, math.hypot(x2 - x1, y2 - y1) / 2
+    return None
+
+
+def in_line(a, b, c, tolerance):
+    # whether b lies within tolerance of the segment a->c, heading the same way
+    dx, dy = c[0] - a[0], c[1] - a[1]
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return False
+    off_line = abs((b[0] - a[0]) * dy - (b[1] - a[1]) * dx) / length
+    along = ((b[0] - a[0]) * dx + (b[1] - a[1]) * dy) / length
+    return off_line <= tolerance and 0 < along < length